@@ -0,0 +1,326 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+import aiohttp
+
+from telethon.errors import FloodWaitError
+
+from bot.config import DEFAULT_PREFIX, MAX_FILE_SIZE, MAX_RETRIES, RETRY_DELAY, CHUNK_SIZE, EXTRACT_PARALLELISM, EXTRACT_RANGE_SIZE
+from bot.upload_downloader import send_file
+from bot.media_probe import is_video, probe_file
+
+class ExtractionStopped(Exception):
+    pass
+
+def call_in_loop(coroutine, loop, should_stop):
+    """Runs `coroutine` on the event loop from the extraction thread, giving up once `should_stop` is set."""
+    future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+    while True:
+        try:
+            return future.result(timeout=1)
+        except concurrent.futures.TimeoutError:
+            if should_stop():
+                future.cancel()
+                raise ExtractionStopped()
+
+class ArchiveStream:
+    """Blocking, forward-only view of an HTTP response body for tarfile's stream mode.
+
+    It is read from the extraction thread, every read is handed to the event loop.
+    """
+
+    def __init__(self, response, loop, should_stop, on_read=None):
+        self.response = response
+        self.loop = loop
+        self.should_stop = should_stop
+        self.on_read = on_read
+        self.consumed = 0
+        self.reported = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        data = call_in_loop(self.response.content.read(size), self.loop, self.should_stop)
+        self.consumed += len(data)
+        # Progress is reported per CHUNK_SIZE, not for every small network read
+        if self.on_read and (self.consumed - self.reported >= CHUNK_SIZE or not data):
+            self.reported = self.consumed
+            self.on_read(self.consumed)
+        return data
+
+class RangeReader:
+    """Seekable, read-only view of a remote file built on HTTP range requests.
+
+    zipfile only needs the central directory at the end of the archive and the bytes of each
+    member, so a zip can be listed and extracted without downloading it as a whole.
+    """
+
+    def __init__(self, session, url, size, loop, should_stop, on_read=None):
+        self.session = session
+        self.url = url
+        self.size = size
+        self.loop = loop
+        self.should_stop = should_stop
+        self.on_read = on_read
+        self.position = 0
+        self.consumed = 0
+        self.block_start = 0
+        self.block = b""
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(0, min(offset, self.size))
+        return self.position
+
+    async def fetch(self, start, end):
+        headers = {"Range": f"bytes={start}-{end}"}
+        async with self.session.get(self.url, headers=headers) as response:
+            response.raise_for_status()
+            if response.status != 206:
+                raise OSError(f"Server ignored range request for {self.url}")
+            return await response.read()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        chunks = []
+        while size > 0 and self.position < self.size:
+            offset = self.position - self.block_start
+            if not 0 <= offset < len(self.block):
+                end = min(self.position + max(size, EXTRACT_RANGE_SIZE), self.size) - 1
+                self.block = call_in_loop(self.fetch(self.position, end), self.loop, self.should_stop)
+                if not self.block:
+                    break
+                self.block_start = self.position
+                offset = 0
+                self.consumed += len(self.block)
+                if self.on_read:
+                    self.on_read(self.consumed)
+            chunk = self.block[offset:offset + size]
+            chunks.append(chunk)
+            self.position += len(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        self.block = b""
+
+def extract_members(archive_type, fileobj, task_id, skip, put, mark_done, should_stop):
+    """Runs in a worker thread: writes one member at a time to its own spool file and hands it to `put`.
+
+    `put` blocks while the upload queue is full, so only a few members are on disk at any time.
+    Returns early once the task is cancelled or the extraction is stopped.
+    """
+    try:
+        iterate_members(archive_type, fileobj, task_id, skip, put, mark_done, should_stop)
+    except ExtractionStopped:
+        logging.info(f"Extraction of task {task_id} stopped")
+
+def iterate_members(archive_type, fileobj, task_id, skip, put, mark_done, should_stop):
+    if archive_type == "tar":
+        archive = tarfile.open(fileobj=fileobj, mode="r|*", bufsize=CHUNK_SIZE)
+        members = ((member, member.name, member.size) for member in archive if member.isfile())
+        open_member = archive.extractfile
+    else:
+        archive = zipfile.ZipFile(fileobj)
+        members = ((info, info.filename, info.file_size) for info in archive.infolist() if not info.is_dir())
+        open_member = archive.open
+
+    with archive:
+        for index, (member, name, size) in enumerate(members):
+            if should_stop():
+                return
+            member_name = os.path.basename(name)
+            if index < skip:
+                continue
+            if not member_name or size > MAX_FILE_SIZE:
+                logging.warning(f"Skipping archive member {name} of task {task_id} ({size} bytes)")
+                mark_done(index)
+                continue
+            member_path = f"temp_{task_id}_{index}"
+            try:
+                with open_member(member) as source, open(member_path, "wb") as target:
+                    shutil.copyfileobj(source, target, CHUNK_SIZE)
+                put((index, member_name, member_path, size))
+            except BaseException:
+                if os.path.exists(member_path):
+                    os.remove(member_path)
+                raise
+
+async def upload_members(event, queue, progress_bar, current_event, user_id, progress_manager, results, is_cancelled, on_uploaded):
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        index, member_name, member_path, size = item
+        file_name = f"{DEFAULT_PREFIX}{member_name}"
+        try:
+            if is_cancelled():
+                continue
+            video_probe = asyncio.create_task(asyncio.to_thread(probe_file, member_path, size)) if is_video(member_name) else None
+            for attempt in range(MAX_RETRIES):
+                try:
+                    await send_file(event, member_path, file_name, size, current_event, user_id, progress_manager, video_probe=video_probe)
+                    results["bytes"] += size
+                    results["count"] += 1
+                    on_uploaded(index)
+                    break
+                except FloodWaitError as e:
+                    logging.warning(f"Flood wait error while uploading archive member {member_name}: {e}")
+                    await asyncio.sleep(e.seconds)
+                except Exception as e:
+                    logging.error(f"Error uploading archive member {member_name} (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
+                    await asyncio.sleep(RETRY_DELAY)
+            else:
+                results["failed"].append(member_name)
+        finally:
+            if os.path.exists(member_path):
+                os.remove(member_path)
+        progress_bar.tracker.update("upload", results["bytes"])
+
+async def extract_and_upload(event, url, archive_type, file_size, task_id, current_event, user_id, progress_manager):
+    try:
+        task_data = progress_manager.get_task(task_id)
+        if task_data is None:
+            logging.error(f"Task data not found for task_id: {task_id}")
+            await current_event.respond("Error: Task data not found. Please try again.")
+            return
+
+        progress_bar = task_data["progress_bar"]
+        tracker = progress_bar.tracker
+        tracker.set_totals(file_size, 0)  # The expanded size is only known once every member is read
+        tracker.start("download")
+
+        # The journal offset of an extract task counts the members uploaded in archive order
+        skip = task_data.get("offset", 0)
+        results = {"uploaded": set(range(skip)), "failed": [], "bytes": 0, "count": 0, "watermark": skip}
+        progress_manager.set_state(task_id, "extracting", offset=skip)
+
+        def on_uploaded(index):
+            # Journal every advance of the contiguous watermark so a restart skips delivered members
+            results["uploaded"].add(index)
+            watermark = results["watermark"]
+            while watermark in results["uploaded"]:
+                watermark += 1
+            if watermark != results["watermark"]:
+                results["watermark"] = watermark
+                progress_manager.set_state(
+                    task_id, "extracting", offset=watermark,
+                    progress_message_id=getattr(progress_bar.message, "id", progress_bar.message)
+                )
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=EXTRACT_PARALLELISM)
+        stop = threading.Event()
+        is_cancelled = lambda: progress_manager.get_cancel_flag(task_id)
+        should_stop = lambda: stop.is_set() or is_cancelled()
+        on_read = lambda consumed: loop.call_soon_threadsafe(tracker.update, "download", consumed)
+
+        def discard_queued():
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item and os.path.exists(item[2]):
+                    os.remove(item[2])
+
+        async def enqueue(item):
+            await queue.put(item)
+            if stop.is_set() and not completed:
+                # A put that was still waiting when the task stopped, nobody consumes it anymore
+                discard_queued()
+                raise ExtractionStopped()
+
+        put = lambda item: call_in_loop(enqueue(item), loop, should_stop)
+        mark_done = lambda index: loop.call_soon_threadsafe(on_uploaded, index)
+
+        completed = False
+        workers = [
+            asyncio.create_task(upload_members(event, queue, progress_bar, current_event, user_id, progress_manager, results, is_cancelled, on_uploaded))
+            for _ in range(EXTRACT_PARALLELISM)
+        ]
+        refresher = asyncio.create_task(refresh_progress(progress_bar))
+        try:
+            async with aiohttp.ClientSession() as session:
+                if archive_type == "zip" and task_data.get("accept_ranges"):
+                    fileobj = RangeReader(session, url, file_size, loop, should_stop, on_read)
+                    await asyncio.to_thread(extract_members, archive_type, fileobj, task_id, skip, put, mark_done, should_stop)
+                else:
+                    async with session.get(url, timeout=None) as response:
+                        response.raise_for_status()
+                        if archive_type == "zip":
+                            # No range support: spool the archive once, zipfile needs to seek
+                            await spool_response(response, f"temp_{task_id}", progress_bar)
+                            with open(f"temp_{task_id}", "rb") as fileobj:
+                                await asyncio.to_thread(extract_members, archive_type, fileobj, task_id, skip, put, mark_done, should_stop)
+                        else:
+                            fileobj = ArchiveStream(response, loop, should_stop, on_read)
+                            await asyncio.to_thread(extract_members, archive_type, fileobj, task_id, skip, put, mark_done, should_stop)
+            completed = True
+        finally:
+            stop.set()  # Lets a still running extraction thread give up instead of blocking shutdown
+            if completed:
+                for _ in workers:
+                    await queue.put(None)
+            else:
+                # Drain what no worker picked up yet, nothing may wait on a full queue of dead workers
+                discard_queued()
+                for worker in workers:
+                    worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            refresher.cancel()
+            if os.path.exists(f"temp_{task_id}"):
+                os.remove(f"temp_{task_id}")
+        tracker.finish("download")
+
+        if progress_manager.get_cancel_flag(task_id):
+            progress_manager.set_state(task_id, "cancelled")
+            return
+        uploaded = results["count"]
+        logging.info(f"Task {task_id} extracted {uploaded} member(s), throughput: {tracker.snapshot()}")
+        if results["failed"]:
+            progress_manager.set_state(task_id, "failed")
+            await progress_bar.stop(f"Uploaded {uploaded} file(s), failed: {', '.join(results['failed'])}")
+        else:
+            progress_manager.set_state(task_id, "done")
+            await progress_bar.stop(f"Extract Complete: uploaded {uploaded} file(s)")
+
+    except (aiohttp.ClientError, tarfile.TarError, zipfile.BadZipFile, OSError) as e:
+        logging.error(f"Error extracting archive {url}: {e}")
+        progress_manager.set_state(task_id, "failed")
+        await current_event.respond(f"Extract Error: {e}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred in extract_and_upload: {e}, url: {url}")
+        progress_manager.set_state(task_id, "failed")
+        await current_event.respond(f"An error occurred: {e}")
+    finally:
+        progress_manager.remove_task(task_id)
+
+async def refresh_progress(progress_bar):
+    # The only place rendering an extract task's status, the thread and the workers just feed the tracker
+    while True:
+        await progress_bar.refresh("download")
+        await asyncio.sleep(1)
+
+async def spool_response(response, path, progress_bar):
+    downloaded_size = 0
+    with open(path, "wb") as spool:
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            spool.write(chunk)
+            downloaded_size += len(chunk)
+            progress_bar.tracker.update("download", downloaded_size)
@@ -13,3 +13,22 @@ CHUNK_SIZE = 2 * 1024 * 1024  # 2 MB
 MAX_RETRIES = 3
 RETRY_DELAY = 5
 MAX_FILE_PARTS = 3000
+
+# Job journal settings (queued and in-flight tasks survive restarts)
+JOURNAL_FILE = "bot/jobs.db"
+JOURNAL_OFFSET_INTERVAL = 8 * 1024 * 1024  # Journal the download offset every 8 MB
+JOURNAL_MAX_AGE = 24 * 60 * 60  # Drop unfinished tasks older than a day on restart
+
+# Archive extraction settings
+EXTRACT_PARALLELISM = 3  # Members uploaded at the same time
+EXTRACT_RANGE_SIZE = 4 * 1024 * 1024  # Bytes fetched per range request when reading zip archives remotely
+
+# Media probe settings (video metadata is read from these ranges only)
+PROBE_HEAD_SIZE = 2 * 1024 * 1024
+PROBE_TAIL_SIZE = 2 * 1024 * 1024
+
+# Runtime settings
+USE_UVLOOP = True  # Run on uvloop when it is installed
+ADMIN_IDS = []  # User IDs allowed to use /stats
+LOOP_LAG_INTERVAL = 0.5  # Longest gap between event loop lag samples (also capped at half the threshold)
+LOOP_LAG_THRESHOLD = 0.1  # Log what blocks the loop when a stall exceeds this many seconds
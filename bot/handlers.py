@@ -3,19 +3,15 @@ import asyncio
 import logging
 import os
 import uuid
-import time
-import math
-import magic
 
-from telethon import events, Button, types
-from telethon.tl.functions.messages import SendMediaRequest
-from telethon.tl.types import InputMediaUploadedDocument, DocumentAttributeFilename
-from telethon.errors import FloodWaitError
+from telethon import Button
 
-from bot.config import DEFAULT_PREFIX, MAX_FILE_SIZE, MAX_RETRIES, RETRY_DELAY, CHUNK_SIZE, MAX_FILE_PARTS
-from bot.utils import get_file_name_extension, extract_filename_from_content_disposition
+from bot.config import DEFAULT_PREFIX, MAX_FILE_SIZE
+from bot.utils import get_file_name_extension, extract_filename_from_content_disposition, get_archive_type, remove_stale_spools
 from bot.progress import ProgressBar
-from bot.upload_downloader import download_and_upload
+from bot.services.throughput import ThroughputTracker
+from bot.upload_downloader import download_and_upload, start_fan_out
+from bot.archive_extractor import extract_and_upload
 
 async def url_processing(event, progress_manager):
     try:
@@ -25,10 +21,14 @@ async def url_processing(event, progress_manager):
 
         await event.delete()
         user_id = event.sender_id
+        tracker = ThroughputTracker()
+        tracker.start("probe")
         async with aiohttp.ClientSession() as session:
             async with session.head(url, allow_redirects=True, timeout=10) as response:
                 response.raise_for_status()
                 file_size = int(response.headers.get('Content-Length', 0))
+                tracker.finish("probe")
+                tracker.set_file_size(file_size)
 
                 if file_size > MAX_FILE_SIZE:
                     await event.respond('File size exceeds the limit of 2GB.')
@@ -53,7 +53,11 @@ async def url_processing(event, progress_manager):
                     "url": url,
                     "mime_type": mime_type,
                     "cancel_flag": False,
-                    "message_id": None
+                    "message_id": None,
+                    "chat_id": event.chat_id,
+                    "user_id": user_id,
+                    "accept_ranges": response.headers.get('Accept-Ranges') == "bytes",
+                    "tracker": tracker
                 }
                 
                 progress_manager.add_task(task_id, task_data)
@@ -61,6 +65,8 @@ async def url_processing(event, progress_manager):
                 logging.info(f"URL Processing - Task data stored: {progress_manager.progress_messages}")
                 buttons = [[Button.inline("Default", data=f"default_{task_id}"),
                             Button.inline("Rename", data=f"rename_{task_id}")]]
+                if get_archive_type(f"{file_name}{file_extension}"):
+                    buttons[0].append(Button.inline("Extract", data=f"extract_{task_id}"))
 
                 message = await event.respond(
                     f"Original File Name: {file_name}{file_extension}\nFile Size: {file_size / (1024 * 1024):.2f} MB\n\nChoose an option:",
@@ -68,6 +74,7 @@ async def url_processing(event, progress_manager):
                 )
 
                 task_data["message_id"] = message.id
+                task_data["message"] = message  # Keep the reference so the background job needs no lookup
                 progress_manager.update_task(task_id,task_data)
 
     except aiohttp.ClientError as e:
@@ -104,14 +111,19 @@ async def download_and_upload_in_background(event, task_data, user_id, progress_
         file_name = f"{DEFAULT_PREFIX}{file_name}{file_extension}"
 
         message_id = task_data.get("message_id")
-        message = await event.client.get_messages(event.chat_id, ids=message_id)
+        message = task_data.get("message")
+        if message is None:  # Only tasks restored from the journal lack the reference
+            message = await event.client.get_messages(event.chat_id, ids=message_id)
 
         if not message:
             logging.error(f"Could not retrieve message with ID: {message_id}")
+            progress_manager.set_state(task_id, "failed")
             await event.respond("Error: Could not find the original message to update.")
             return
 
-        progress_bar = ProgressBar(file_size, "Processing", event.client, event, task_id, file_name, file_size)
+        progress_bar = ProgressBar(file_size, "Processing", event.client, event, task_id, file_name, file_size, tracker=task_data.get("tracker"))
+        if task_data.get("progress_message_id"):
+            progress_bar.message = task_data["progress_message_id"]  # Reattach the status message of a resumed task
         task_data["progress_bar"] = progress_bar
         progress_manager.update_task(task_id, task_data)
 
@@ -119,11 +131,45 @@ async def download_and_upload_in_background(event, task_data, user_id, progress_
 
     except Exception as e:
         logging.error(f"Error in background download and upload: {e}")
+        progress_manager.set_state(task_id, "failed")
         await event.respond(f"An error occurred during the download and upload process.")
 
     finally:
         progress_manager.remove_task(task_id)
 
+async def extract_handler(event, progress_manager):
+    task_id = event.data.decode().split('_')[1]
+    user_id = event.sender_id
+
+    task_data = progress_manager.get_task(task_id)
+
+    if task_data:
+        asyncio.create_task(extract_in_background(event, task_data, user_id, progress_manager))
+    else:
+        await event.answer("No Active Download")
+
+async def extract_in_background(event, task_data, user_id, progress_manager):
+    try:
+        file_name = f"{task_data['file_name']}{task_data['file_extension']}"
+        file_size = task_data["file_size"]
+        task_id = task_data["task_id"]
+
+        progress_bar = ProgressBar(file_size, "Extracting", event.client, event, task_id, file_name, file_size, tracker=task_data.get("tracker"))
+        if task_data.get("progress_message_id"):
+            progress_bar.message = task_data["progress_message_id"]  # Reattach the status message of a resumed task
+        task_data["progress_bar"] = progress_bar
+        progress_manager.update_task(task_id, task_data)
+
+        await extract_and_upload(event, task_data["url"], get_archive_type(file_name), file_size, task_id, event, user_id, progress_manager)
+
+    except Exception as e:
+        logging.error(f"Error in background extract and upload: {e}")
+        progress_manager.set_state(task_id, "failed")
+        await event.respond(f"An error occurred during the extract and upload process.")
+
+    finally:
+        progress_manager.remove_task(task_id)
+
 async def rename_handler(event, progress_manager):
     try:
         task_id = event.data.decode().split('_')[1]
@@ -143,6 +189,7 @@ async def cancel_handler(event, progress_manager):
         task_data = progress_manager.get_task(task_id)
         if task_data:
             progress_manager.set_cancel_flag(task_id, True)
+            progress_manager.set_state(task_id, "cancelled")
             progress_bar = task_data.get("progress_bar")
             if progress_bar:
                 await progress_bar.stop("Cancelled by User")
@@ -175,6 +222,7 @@ async def rename_process(event, progress_manager):
 
             message = await event.respond(f"Your new file name is: {new_file_name}")
             task_data["message_id"] = message.id
+            task_data["message"] = message
             task_data["status"] = "default"
             task_data["file_name"] = new_file_name  # Update the file_name in task_data
             progress_manager.update_task(task_id,task_data)
@@ -184,3 +232,40 @@ async def rename_process(event, progress_manager):
     except Exception as e:
         logging.error(f"Error in rename_process: {e}")
         await event.respond(f"An error occurred. Please try again later")
+
+class JournaledEvent:
+    """Stands in for the original event of a task restored from the job journal."""
+
+    def __init__(self, client, chat_id, sender_id):
+        self.client = client
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+
+    async def respond(self, message, **kwargs):
+        return await self.client.send_message(self.chat_id, message, **kwargs)
+
+async def resume_journaled_tasks(client, progress_manager):
+    tasks = progress_manager.restore_tasks()
+    # Only a resumed download continues from its spool, extract member spools and those of dropped tasks go
+    remove_stale_spools({
+        task_id for task_id, task_data in tasks.items()
+        if task_data.get("state") in ("downloading", "uploading") and task_data.get("chat_id")
+    })
+    for task_id, task_data in tasks.items():
+        if task_data.get("state") == "fanning_out":
+            logging.info(f"Resuming fan-out {task_id} to {len(task_data['fan_out']['destinations'])} destination(s)")
+            start_fan_out(client, task_id, progress_manager)
+            continue
+        if task_data.get("state") not in ("downloading", "uploading", "extracting"):
+            continue  # Still waiting for Default/Rename, the original buttons keep working
+        if not task_data.get("chat_id"):
+            logging.warning(f"Cannot resume task {task_id}: no chat recorded in the journal")
+            progress_manager.set_state(task_id, "failed")
+            progress_manager.remove_task(task_id)
+            continue
+        logging.info(f"Resuming task {task_id} ({task_data['state']}, offset {task_data.get('offset', 0)})")
+        event = JournaledEvent(client, task_data["chat_id"], task_data.get("user_id"))
+        if task_data["state"] == "extracting":
+            asyncio.create_task(extract_in_background(event, task_data, task_data.get("user_id"), progress_manager))
+        else:
+            asyncio.create_task(download_and_upload_in_background(event, task_data, task_data.get("user_id"), progress_manager))
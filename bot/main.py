@@ -1,17 +1,22 @@
+import time
+_startup_time = time.perf_counter()  # Taken before the heavy imports so startup-to-ready covers them
+
 import asyncio
 import logging
 
-from telethon import TelegramClient, events, Button
-from telethon.errors import FloodWaitError
+from telethon import TelegramClient, events
 
-from bot.config import API_ID, API_HASH, BOT_TOKEN
-from bot.handlers import url_processing, default_file_handler, rename_handler, cancel_handler, rename_process
+from bot.config import API_ID, API_HASH, BOT_TOKEN, JOURNAL_FILE, JOURNAL_MAX_AGE, USE_UVLOOP, ADMIN_IDS, LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+from bot.handlers import url_processing, default_file_handler, extract_handler, rename_handler, cancel_handler, rename_process, resume_journaled_tasks
+from bot.services.job_journal import JobJournal
+from bot.services.loop_monitor import LoopLagMonitor
 from bot.services.progress_manager import ProgressManager
-from bot.settings_handlers import settings_handler, set_thumbnail_handler, set_prefix_handler, add_rename_rule_handler, remove_rename_rule_handler, remove_rule_callback_handler, done_settings_handler, process_settings_input
+from bot.settings_handlers import settings_handler, set_thumbnail_handler, set_prefix_handler, add_rename_rule_handler, remove_rename_rule_handler, remove_rule_callback_handler, add_destination_handler, remove_destination_handler, remove_destination_callback_handler, done_settings_handler, process_settings_input
 
 # Initialize the bot
 bot = TelegramClient('bot', API_ID, API_HASH)
-progress_manager = ProgressManager()
+progress_manager = ProgressManager(JobJournal(JOURNAL_FILE, JOURNAL_MAX_AGE))
+loop_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD)
 
 # Handlers
 async def start_handler(event):
@@ -33,6 +38,7 @@ async def help_handler(event):
         "1. Send me a direct download URL (max 2GB).\n"
         "2. Choose **Default** to upload with the original filename.\n"
         "3. Choose **Rename** to give the file a custom name.\n"
+        "   For .zip/.tar archives, **Extract** uploads the files inside instead.\n"
         "4. You can use the /cancel command to stop the process.\n\n"
         "**Available Commands:**\n"
         f"/start - Start the bot\n"
@@ -41,11 +47,32 @@ async def help_handler(event):
         f"/cancel - Cancel the current operation"
     )
 
+def running_rate(tasks, phase):
+    # Finished phases keep their last rate, only count the ones still in progress
+    phases = (task["progress_bar"].tracker.phases[phase] for task in tasks)
+    return sum(p.rate() for p in phases if p.started_at is not None and p.finished_at is None)
+
+async def stats_handler(event):
+    if event.sender_id not in ADMIN_IDS:
+        return
+    loop = asyncio.get_running_loop()
+    tasks = [task for task in progress_manager.progress_messages.values() if task.get("progress_bar")]
+    download_rate = running_rate(tasks, "download")
+    upload_rate = running_rate(tasks, "upload")
+    await event.respond(
+        "**Runtime Stats**\n\n"
+        f"Event loop: {type(loop).__module__}.{type(loop).__name__}\n"
+        f"Queued tasks: {len(progress_manager.progress_messages)}, running: {len(tasks)}\n"
+        f"Download: {download_rate / 1024:.2f} KB/s, Upload: {upload_rate / 1024:.2f} KB/s\n\n"
+        f"**Loop Lag**\n{loop_monitor.report()}"
+    )
+
 
 # Register handlers
 def register_handlers(bot, progress_manager):
     bot.add_event_handler(start_handler, events.NewMessage(pattern='/start'))
     bot.add_event_handler(help_handler, events.NewMessage(pattern='/help'))
+    bot.add_event_handler(stats_handler, events.NewMessage(pattern='/stats'))
     bot.add_event_handler(
         lambda event: url_processing(event, progress_manager), events.NewMessage
     )
@@ -55,6 +82,9 @@ def register_handlers(bot, progress_manager):
     bot.add_event_handler(
         lambda event: default_file_handler(event, progress_manager), events.CallbackQuery(data=lambda data: data.decode().startswith('default_'))
     )
+    bot.add_event_handler(
+        lambda event: extract_handler(event, progress_manager), events.CallbackQuery(data=lambda data: data.decode().startswith('extract_'))
+    )
     bot.add_event_handler(
         lambda event: rename_handler(event, progress_manager), events.CallbackQuery(data=lambda data: data.decode().startswith('rename_'))
     )
@@ -67,16 +97,28 @@ def register_handlers(bot, progress_manager):
     bot.add_event_handler(add_rename_rule_handler, events.CallbackQuery(data=lambda data: data.decode() == 'add_rename_rule'))
     bot.add_event_handler(remove_rename_rule_handler, events.CallbackQuery(data=lambda data: data.decode() == 'remove_rename_rule'))
     bot.add_event_handler(remove_rule_callback_handler, events.CallbackQuery(data=lambda data: data.decode().startswith('remove_rule_')))
+    bot.add_event_handler(add_destination_handler, events.CallbackQuery(data=lambda data: data.decode() == 'add_destination'))
+    bot.add_event_handler(remove_destination_handler, events.CallbackQuery(data=lambda data: data.decode() == 'remove_destination'))
+    bot.add_event_handler(remove_destination_callback_handler, events.CallbackQuery(data=lambda data: data.decode().startswith('remove_dest_')))
     bot.add_event_handler(done_settings_handler, events.CallbackQuery(data=lambda data: data.decode() == 'done_settings'))
     bot.add_event_handler(process_settings_input, events.NewMessage)
 
 
 async def main():
+    loop_monitor.start()
     register_handlers(bot, progress_manager) # Register handlers
     await bot.start(bot_token=BOT_TOKEN)
-    print("Bot has started successfully and is now running...")
+    await resume_journaled_tasks(bot, progress_manager) # Rebuild the queue from the job journal
+    print(f"Bot has started successfully and is now running... (ready in {time.perf_counter() - _startup_time:.2f}s)")
     await bot.run_until_disconnected()
 
 if __name__ == '__main__':
     logging.basicConfig(format='[%(levelname) 5s/%(asctime)s] %(name)s: %(message)s', level=logging.INFO)
+    if USE_UVLOOP:
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            logging.info("Using uvloop event loop")
+        except ImportError:
+            logging.info("uvloop is not installed, using the default asyncio event loop")
     asyncio.run(main())
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+import struct
+import aiohttp
+
+from bot.config import PROBE_HEAD_SIZE, PROBE_TAIL_SIZE
+
+VIDEO_EXTENSIONS = (".mp4", ".m4v", ".mov", ".mkv", ".webm")
+
+# Matroska / WebM element ids
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+class ProbeData:
+    """The first and last few MB of a file, addressed by their offsets in the full file."""
+
+    def __init__(self, head, tail, file_size):
+        self.head = head
+        self.tail = tail
+        self.file_size = file_size
+        self.tail_start = file_size - len(tail)
+
+    def get(self, offset, size):
+        if offset + size <= len(self.head):
+            return self.head[offset:offset + size]
+        if offset >= self.tail_start and offset + size <= self.file_size:
+            return self.tail[offset - self.tail_start:offset - self.tail_start + size]
+        return None
+
+def is_video(file_name, mime_type=None):
+    return file_name.lower().endswith(VIDEO_EXTENSIONS) or bool(mime_type and mime_type.startswith("video/"))
+
+def thumbnail_offset(duration):
+    """Picks the frame Telegram shows as the video thumbnail: 10% in, skipping intros, at most a minute."""
+    return min(duration * 0.1, 60.0)
+
+def iter_boxes(data, start=0, end=None):
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, min(offset + size, end)
+        offset += size
+
+def parse_mvhd(data, start):
+    version = data[start]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, start + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, start + 12)
+    return duration / timescale if timescale else 0
+
+def parse_trak(data, start, end):
+    width = height = 0
+    handler = None
+    for box_type, box_start, box_end in iter_boxes(data, start, end):
+        if box_type == b"tkhd":
+            # Width and height are the last two 16.16 fixed point fields of the box
+            width, height = struct.unpack_from(">II", data, box_end - 8)
+            width, height = width >> 16, height >> 16
+        elif box_type == b"mdia":
+            for child_type, child_start, child_end in iter_boxes(data, box_start, box_end):
+                if child_type == b"hdlr":
+                    handler = data[child_start + 8:child_start + 12]
+    return handler, width, height
+
+def probe_mp4(probe_data):
+    offset = 0
+    mdat_seen = False
+    while offset + 8 <= probe_data.file_size:
+        header = probe_data.get(offset, 16) or probe_data.get(offset, 8)
+        if header is None:
+            return None  # The moov box is neither in the head nor in the tail
+        size, box_type = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if size == 1 and len(header) == 16:
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = probe_data.file_size - offset
+        if size < header_size:
+            return None
+
+        if box_type == b"moov":
+            moov = probe_data.get(offset + header_size, size - header_size)
+            if moov is None:
+                return None
+            duration, width, height = 0, 0, 0
+            for child_type, child_start, child_end in iter_boxes(moov):
+                if child_type == b"mvhd":
+                    duration = parse_mvhd(moov, child_start)
+                elif child_type == b"trak" and not width:
+                    handler, track_width, track_height = parse_trak(moov, child_start, child_end)
+                    if handler == b"vide":
+                        width, height = track_width, track_height
+            # Telegram can only stream a file whose index comes before the media data
+            return {"duration": duration, "width": width, "height": height, "supports_streaming": not mdat_seen}
+        if box_type == b"mdat":
+            mdat_seen = True
+        offset += size
+    return None
+
+def read_vint(data, offset, keep_marker=False):
+    first = data[offset]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or offset + length > len(data):
+        raise ValueError("Invalid EBML variable size integer")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[offset + 1:offset + length]:
+        value = (value << 8) | byte
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, length, unknown
+
+def iter_elements(data, start, end):
+    offset = start
+    while offset < end:
+        element_id, id_length, _ = read_vint(data, offset, keep_marker=True)
+        size, size_length, unknown = read_vint(data, offset + id_length)
+        body = offset + id_length + size_length
+        body_end = end if unknown else min(body + size, end)
+        yield element_id, body, body_end
+        offset = body_end
+
+def read_uint(data, start, end):
+    return int.from_bytes(data[start:end], "big")
+
+def probe_mkv(probe_data):
+    data = probe_data.head
+    timecode_scale = 1000000
+    duration = 0
+    width = height = 0
+    for element_id, start, end in iter_elements(data, 0, len(data)):
+        if element_id != SEGMENT:
+            continue
+        for child_id, child_start, child_end in iter_elements(data, start, end):
+            if child_id == INFO:
+                for info_id, info_start, info_end in iter_elements(data, child_start, child_end):
+                    if info_id == TIMECODE_SCALE:
+                        timecode_scale = read_uint(data, info_start, info_end)
+                    elif info_id == DURATION:
+                        duration = struct.unpack(">f" if info_end - info_start == 4 else ">d", data[info_start:info_end])[0]
+            elif child_id == TRACKS:
+                for entry_id, entry_start, entry_end in iter_elements(data, child_start, child_end):
+                    if entry_id != TRACK_ENTRY or width:
+                        continue
+                    track_type, video = None, None
+                    for track_id, track_start, track_end in iter_elements(data, entry_start, entry_end):
+                        if track_id == TRACK_TYPE:
+                            track_type = read_uint(data, track_start, track_end)
+                        elif track_id == VIDEO:
+                            video = (track_start, track_end)
+                    if track_type == 1 and video:
+                        for video_id, video_start, video_end in iter_elements(data, *video):
+                            if video_id == PIXEL_WIDTH:
+                                width = read_uint(data, video_start, video_end)
+                            elif video_id == PIXEL_HEIGHT:
+                                height = read_uint(data, video_start, video_end)
+            elif child_id == CLUSTER:
+                break  # Media data starts, the headers are all behind us
+        break
+    if not duration and not width:
+        return None
+    return {"duration": duration * timecode_scale / 1e9, "width": width, "height": height, "supports_streaming": False}
+
+def probe_media(head, tail, file_size):
+    """Reads duration and dimensions of an MP4 or Matroska file from its first and last bytes only."""
+    probe_data = ProbeData(head, tail, file_size)
+    try:
+        if head[4:8] == b"ftyp":
+            metadata = probe_mp4(probe_data)
+        elif head[:4] == EBML_HEADER.to_bytes(4, "big"):
+            metadata = probe_mkv(probe_data)
+        else:
+            return None
+    except (struct.error, ValueError, IndexError) as e:
+        logging.warning(f"Failed to parse media headers: {e}")
+        return None
+    if not metadata or not (metadata["width"] and metadata["height"]):
+        return None  # No video track, e.g. audio-only MP4, is sent as a plain document
+    metadata["thumbnail_offset"] = thumbnail_offset(metadata["duration"])
+    return metadata
+
+def probe_file(path, file_size):
+    with open(path, "rb") as f:
+        head = f.read(PROBE_HEAD_SIZE)
+        f.seek(max(file_size - PROBE_TAIL_SIZE, 0))
+        tail = f.read()
+    return probe_media(head, tail, file_size)
+
+async def fetch_range(session, url, start, end):
+    async with session.get(url, headers={"Range": f"bytes={start}-{end}"}) as response:
+        response.raise_for_status()
+        if response.status != 206:
+            raise aiohttp.ClientPayloadError(f"Server ignored range request for {url}")
+        return await response.read()
+
+async def probe_url(url, file_size):
+    """Probes a remote file with two range requests, so it can run alongside the download."""
+    try:
+        async with aiohttp.ClientSession() as session:
+            head, tail = await asyncio.gather(
+                fetch_range(session, url, 0, min(PROBE_HEAD_SIZE, file_size) - 1),
+                fetch_range(session, url, max(file_size - PROBE_TAIL_SIZE, 0), file_size - 1)
+            )
+        return probe_media(head, tail, file_size)
+    except aiohttp.ClientError as e:
+        logging.warning(f"Range probe of {url} failed: {e}")
+        return None
+
+async def probe_transfer(url, path, file_size, accept_ranges, download_done):
+    """Probes by range requests while the download runs, falling back to the spool file once it completes."""
+    if accept_ranges:
+        metadata = await probe_url(url, file_size)
+        if metadata:
+            return metadata
+    await download_done.wait()
+    if not os.path.exists(path):
+        return None
+    return await asyncio.to_thread(probe_file, path, file_size)
@@ -3,11 +3,11 @@ import asyncio
 import logging
 from telethon import Button
 
+from bot.services.throughput import ThroughputTracker
+
 class ProgressBar:
-    def __init__(self, total, description, client, event, task_id, file_name, file_size):
+    def __init__(self, total, description, client, event, task_id, file_name, file_size, tracker=None):
         self.total = total
-        self.current = 0
-        self.start_time = time.time()
         self.description = description
         self.last_update_time = 0
         self.client = client
@@ -16,85 +16,95 @@ class ProgressBar:
         self.file_name = file_name
         self.file_size = file_size
         self.message = None
-        self.start_time = time.time()
         self.last_sent_progress = 0
         self.done = False
-        self.download_speed = 0
-        self.upload_speed = 0
-        self.average_download_speed_buffer = []
-        self.average_upload_speed_buffer = []
+        self.tracker = tracker or ThroughputTracker(file_size)
+        self.tracker.set_file_size(file_size)
         self.message_id = None
+        self.render_lock = asyncio.Lock()  # One status edit at a time, overlapping calls skip rendering
 
     def set_message_id(self, message_id):
         self.message_id = message_id
 
-    def update_average_speed(self, speed, buffer):
-        buffer.append(speed)
-        if len(buffer) > 5:
-            buffer.pop(0)
-        return sum(buffer) / len(buffer) if buffer else 0
-
-    async def update_progress(self, progress, download_speed=None, upload_speed=None):
-        try:
-            self.current = int(progress * self.total)
-            percentage = int((self.current / self.total) * 100)
+    @staticmethod
+    def format_speed(speed):
+        return f"{speed / 1024:.2f} KB/s" if speed else "-"
 
-            if self.done:
-                return
+    @staticmethod
+    def format_eta(seconds):
+        if seconds is None:
+            return "-"
+        return f"{int(seconds)}s" if seconds < 60 else f"{int(seconds / 60)}m {int(seconds % 60)}s"
 
-            if (percentage - self.last_sent_progress) >= 5 or percentage == 100:
-                now = time.time()
-                if self.current > 0 and (now - self.last_update_time > 0.5):  # Prevent excessive updates
-                    elapsed_time = now - self.start_time
+    async def update_progress(self, phase, current):
+        """Feeds `current` bytes of `phase` into the tracker and edits the status message when due."""
+        if self.done:
+            return
+        self.tracker.update(phase, current)
+        await self.refresh(phase)
 
-                    if percentage != 0:
-                        time_remaining = ((self.total - self.current) / (self.current / elapsed_time))
-                        estimated_time_str = f"{int(time_remaining)}s" if time_remaining < 60 else f"{int(time_remaining / 60)}m {int(time_remaining % 60)}s"
+    async def refresh(self, phase):
+        """Edits the status message from the tracker when due, without feeding it a new sample."""
+        if self.done or self.render_lock.locked():
+            return  # A render is in flight, the next call picks up the newer numbers
+        try:
+            async with self.render_lock:
+                await self.render(phase)
+        except Exception as e:
+            logging.error(f"Error in update progress method: {e}")
 
-                        if download_speed is not None:
-                            self.download_speed = self.update_average_speed(download_speed, self.average_download_speed_buffer)
-                        if upload_speed is not None:
-                            self.upload_speed = self.update_average_speed(upload_speed, self.average_upload_speed_buffer)
+    async def render(self, phase):
+        if self.done:
+            return
+        percentage = int(self.tracker.fraction() * 100)
 
-                        download_speed_str = f" {self.download_speed / 1024:.2f} KB/s" if self.download_speed else ""
-                        upload_speed_str = f" {self.upload_speed / 1024:.2f} KB/s" if self.upload_speed else ""
+        if (percentage - self.last_sent_progress) >= 5 or percentage == 100:
+            now = time.time()
+            if percentage > 0 and (now - self.last_update_time > 0.5):  # Prevent excessive updates
+                download = self.tracker.phases["download"]
+                upload = self.tracker.phases["upload"]
 
-                        message_text = f"**{self.description}: {self.file_name}**\n"
-                        message_text += f"File Size: {self.file_size / (1024 * 1024):.2f} MB\n"
-                        message_text += f"Download Speed: {download_speed_str} Upload Speed: {upload_speed_str}\n"
-                        message_text += f"ETA: {estimated_time_str}\n"
-                        message_text += f"[{'#' * int(percentage / 10) + '-' * (10 - int(percentage / 10))}] {percentage}%"
+                message_text = f"**{self.description}: {self.file_name}**\n"
+                message_text += f"File Size: {self.file_size / (1024 * 1024):.2f} MB\n"
+                message_text += f"Download Speed: {self.format_speed(download.rate())} Upload Speed: {self.format_speed(upload.rate())}\n"
+                message_text += f"Current: {self.format_speed(self.tracker.phases[phase].instant_rate())}\n"
+                message_text += f"ETA: {self.format_eta(self.tracker.eta())}\n"
+                message_text += f"[{'#' * int(percentage / 10) + '-' * (10 - int(percentage / 10))}] {percentage}%"
 
-                        if self.message:
-                            try:
-                                await self.client.edit_message(self.event.chat_id, self.message, message_text,
-                                                                buttons=[[Button.inline("Cancel", data=f"cancel_{self.task_id}")]])
-                            except Exception as e:
-                                if "FloodWait" in str(e):
-                                    logging.warning(f"Flood Wait detected in edit message, waiting to retry: {e}")
-                                    await asyncio.sleep(int(str(e).split(" ")[-1]))
-                                    await self.update_progress(progress, download_speed, upload_speed)
-                                else:
-                                    logging.error(f"Failed to edit progress message: {e}, message id: {self.message}")
+                if self.message:
+                    try:
+                        await self.client.edit_message(self.event.chat_id, self.message, message_text,
+                                                        buttons=[[Button.inline("Cancel", data=f"cancel_{self.task_id}")]])
+                    except Exception as e:
+                        if "FloodWait" in str(e):
+                            logging.warning(f"Flood Wait detected in edit message, waiting to retry: {e}")
+                            await asyncio.sleep(int(str(e).split(" ")[-1]))
+                            await self.render(phase)
+                            return
                         else:
-                            try:
-                                self.message = await self.client.send_message(self.event.chat_id, message_text,
-                                                                    buttons=[[Button.inline("Cancel", data=f"cancel_{self.task_id}")]])
-                            except Exception as e:
-                                if "FloodWait" in str(e):
-                                    logging.warning(f"Flood Wait detected in send message, waiting to retry: {e}")
-                                    await asyncio.sleep(int(str(e).split(" ")[-1]))
-                                    await self.update_progress(progress, download_speed, upload_speed)
-                                else:
-                                    logging.error(f"Failed to send progress message: {e}")
+                            logging.error(f"Failed to edit progress message: {e}, message id: {self.message}")
+                else:
+                    try:
+                        self.message = await self.client.send_message(self.event.chat_id, message_text,
+                                                            buttons=[[Button.inline("Cancel", data=f"cancel_{self.task_id}")]])
+                    except Exception as e:
+                        if "FloodWait" in str(e):
+                            logging.warning(f"Flood Wait detected in send message, waiting to retry: {e}")
+                            await asyncio.sleep(int(str(e).split(" ")[-1]))
+                            await self.render(phase)
+                            return
+                        else:
+                            logging.error(f"Failed to send progress message: {e}")
 
-                    self.last_update_time = now
-                    self.last_sent_progress = percentage
-        except Exception as e:
-            logging.error(f"Error in update progress method: {e}")
+                self.last_update_time = now
+                self.last_sent_progress = percentage
 
     async def stop(self, text="Canceled"):
         self.done = True
+        async with self.render_lock:  # Let an in-flight render finish so it cannot overwrite the final text
+            await self.send_final(text)
+
+    async def send_final(self, text):
         if self.message:
             try:
                 await self.client.edit_message(self.event.chat_id, self.message, text)
@@ -102,7 +112,7 @@ class ProgressBar:
                 if "FloodWait" in str(e):
                     logging.warning(f"Flood Wait detected in stop message, waiting to retry: {e}")
                     await asyncio.sleep(int(str(e).split(" ")[-1]))
-                    await self.stop(text)
+                    await self.send_final(text)
                 else:
                     logging.error(f"Failed to edit final message: {e}, message id: {self.message}")
         else:
@@ -112,6 +122,6 @@ class ProgressBar:
                 if "FloodWait" in str(e):
                     logging.warning(f"Flood Wait detected in stop message, waiting to retry: {e}")
                     await asyncio.sleep(int(str(e).split(" ")[-1]))
-                    await self.stop(text)
+                    await self.send_final(text)
                 else:
                     logging.error(f"Failed to send final message: {e}")
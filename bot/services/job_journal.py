@@ -0,0 +1,81 @@
+# bot/services/job_journal.py
+import json
+import logging
+import sqlite3
+import time
+
+TERMINAL_STATES = ("done", "cancelled", "failed")
+
+# Only plain task fields are journaled, live objects like the progress bar are rebuilt on resume
+JOURNALED_FIELDS = (
+    "task_id", "chat_id", "user_id", "message_id", "progress_message_id", "file_name",
+    "file_extension", "file_size", "url", "mime_type", "status", "accept_ranges", "fan_out"
+)
+
+class JobJournal:
+    """Append-only SQLite (WAL) log of task state transitions and download offsets."""
+
+    def __init__(self, path, max_age):
+        self.path = path
+        self.max_age = max_age
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, task_id TEXT NOT NULL, state TEXT NOT NULL, "
+            "offset INTEGER, data TEXT, ts REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS journal_task ON journal (task_id, seq)")
+
+    def record(self, task_id, state, offset=None, data=None):
+        payload = None
+        if data:
+            payload = json.dumps({key: data[key] for key in JOURNALED_FIELDS if key in data})
+        try:
+            self.conn.execute(
+                "INSERT INTO journal (task_id, state, offset, data, ts) VALUES (?, ?, ?, ?, ?)",
+                (task_id, state, offset, payload, time.time())
+            )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to journal state {state} for task {task_id}: {e}")
+
+    def pending(self):
+        """Replays the journal and returns the last known data of every unfinished task."""
+        tasks = {}
+        rows = self.conn.execute("SELECT task_id, state, offset, data, ts FROM journal ORDER BY seq")
+        for task_id, state, offset, data, ts in rows:
+            task = tasks.setdefault(task_id, {"task_id": task_id, "offset": 0})
+            if data:
+                task.update(json.loads(data))
+            if offset is not None:
+                task["offset"] = offset
+            task["state"] = state
+            task["updated_at"] = ts
+
+        now = time.time()
+        return {
+            task_id: task for task_id, task in tasks.items()
+            if task["state"] not in TERMINAL_STATES and now - task["updated_at"] < self.max_age
+        }
+
+    def compact(self, tasks):
+        """Rewrites the journal so it only holds one snapshot row per task in `tasks`."""
+        try:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM journal")
+            for task_id, task in tasks.items():
+                self.conn.execute(
+                    "INSERT INTO journal (task_id, state, offset, data, ts) VALUES (?, ?, ?, ?, ?)",
+                    (task_id, task["state"], task.get("offset", 0),
+                     json.dumps({key: task[key] for key in JOURNALED_FIELDS if key in task}),
+                     task["updated_at"])
+                )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            logging.error(f"Failed to compact job journal {self.path}: {e}")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,126 @@
+# bot/services/loop_monitor.py
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+LAG_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, float("inf"))
+
+class LoopLagMonitor:
+    """Measures event loop scheduling delay and names the code that blocks the loop.
+
+    A coroutine sleeps at most `interval` seconds, and at most half of `threshold`, then records
+    how late it woke up. A watchdog thread polls every `threshold / 2` and looks at the loop thread's
+    stack once that heartbeat is more than `threshold` overdue, so a stall is attributed to the
+    function running at that moment.
+    """
+
+    def __init__(self, interval, threshold):
+        self.interval = interval
+        self.threshold = threshold
+        # Short enough that a stall just over the threshold still overlaps a wake-up deadline
+        self.sample_period = min(interval, threshold / 2)
+        self.histogram = [0] * len(LAG_BUCKETS_MS)
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.blockers = {}  # location -> [stalls, worst lag in seconds]
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.task = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.sample())
+        threading.Thread(target=self.watch, name="loop-lag-watchdog", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+
+    async def sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.sample_period
+            await asyncio.sleep(self.sample_period)
+            self.record(max(loop.time() - expected, 0.0))
+            self.heartbeat = time.monotonic()
+
+    def record(self, lag):
+        lag_ms = lag * 1000
+        for index, bound in enumerate(LAG_BUCKETS_MS):
+            if lag_ms < bound:
+                self.histogram[index] += 1
+                break
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def watch(self):
+        reported = None
+        while not self.stopped.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat - self.sample_period
+            if stalled < self.threshold:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            location = self.describe(stack)
+            blocker = self.blockers.setdefault(location, [0, 0.0])
+            if reported != heartbeat:
+                # One stall is counted once, even if the watchdog sees it several times
+                reported = heartbeat
+                blocker[0] += 1
+                logging.warning(
+                    f"Event loop blocked for {stalled * 1000:.0f} ms in {location}\n"
+                    + "".join(traceback.format_list(stack[-5:]))
+                )
+            blocker[1] = max(blocker[1], stalled)
+
+    @staticmethod
+    def describe(stack):
+        # Prefer the innermost frame of our own code over library internals
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for frame in reversed(stack):
+            if frame.filename.startswith(package_dir):
+                return f"{os.path.relpath(frame.filename, os.path.dirname(package_dir))}:{frame.lineno} in {frame.name}"
+        frame = stack[-1]
+        return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+    def percentile(self, fraction):
+        """Upper bound of the histogram bucket holding the given fraction of samples, in ms."""
+        if not self.samples:
+            return 0
+        target = fraction * self.samples
+        seen = 0
+        for bound, count in zip(LAG_BUCKETS_MS, self.histogram):
+            seen += count
+            if seen >= target:
+                return bound
+        return LAG_BUCKETS_MS[-1]
+
+    def report(self, top=5):
+        lines = [
+            f"Samples: {self.samples}, mean lag: {self.total_lag / self.samples * 1000 if self.samples else 0:.2f} ms, "
+            f"max lag: {self.max_lag * 1000:.0f} ms",
+            f"p50 < {self.percentile(0.5)} ms, p99 < {self.percentile(0.99)} ms",
+        ]
+        lower = 0
+        for bound, count in zip(LAG_BUCKETS_MS, self.histogram):
+            label = f"{lower}-{bound} ms" if bound != float("inf") else f">= {lower} ms"
+            lines.append(f"  {label}: {count}")
+            lower = bound
+        worst = sorted(self.blockers.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        if worst:
+            lines.append("Slowest blockers:")
+            lines.extend(f"  {stalls}x, up to {lag * 1000:.0f} ms: {location}" for location, (stalls, lag) in worst)
+        return "\n".join(lines)
@@ -2,11 +2,14 @@
 import logging
 
 class ProgressManager:
-    def __init__(self):
+    def __init__(self, journal=None):
         self.progress_messages = {}
+        self.journal = journal
 
     def add_task(self, task_id, data):
         self.progress_messages[task_id] = data
+        if self.journal:
+            self.journal.record(task_id, data.get("state", "queued"), data=data)
 
     def get_task(self, task_id):
         return self.progress_messages.get(task_id)
@@ -18,12 +21,17 @@ class ProgressManager:
     def update_task(self, task_id, task_data):
         if task_id in self.progress_messages:
             self.progress_messages[task_id] = task_data
+            if self.journal:
+                self.journal.record(task_id, task_data.get("state", "queued"), data=task_data)
         else:
             logging.error(f"Task ID {task_id} not found in progress_messages.")
 
     def update_task_status(self, task_id, status):
         if task_id in self.progress_messages:
             self.progress_messages[task_id]["status"] = status
+            if self.journal:
+                task = self.progress_messages[task_id]
+                self.journal.record(task_id, task.get("state", "queued"), data=task)
         else:
             logging.error(f"Task ID {task_id} not found in progress_messages.")
 
@@ -50,3 +58,25 @@ class ProgressManager:
         if task:
             task["message_id"] = message_id
             self.progress_messages[task_id] = task  # Update the task in progress_messages
+
+    def set_state(self, task_id, state, offset=None, **fields):
+        task = self.get_task(task_id)
+        if task:
+            task["state"] = state
+            task.update(fields)
+            if offset is not None:
+                task["offset"] = offset
+        if self.journal:
+            self.journal.record(task_id, state, offset=offset, data=fields or None)
+
+    def restore_tasks(self):
+        """Reloads unfinished tasks from the journal and returns them."""
+        if not self.journal:
+            return {}
+        tasks = self.journal.pending()
+        self.journal.compact(tasks)
+        for task_id, task_data in tasks.items():
+            task_data["cancel_flag"] = False
+            self.progress_messages[task_id] = task_data
+        logging.info(f"Restored {len(tasks)} task(s) from the job journal")
+        return tasks
@@ -0,0 +1,142 @@
+# bot/services/throughput.py
+import math
+import time
+from collections import deque
+
+PHASES = ("probe", "download", "upload", "send")
+
+RATE_WINDOW = 16  # Samples kept for the instantaneous rate
+EWMA_TIME_CONSTANT = 5.0  # Seconds, how quickly the smoothed rate follows changes
+
+class PhaseThroughput:
+    """Byte counter of one phase with an instantaneous (ring buffer) and a smoothed (EWMA) rate.
+
+    `update` is O(1) so it can be called for every chunk.
+    """
+
+    __slots__ = ("total", "done", "first_done", "started_at", "finished_at", "samples", "ewma")
+
+    def __init__(self, total=0):
+        self.total = total
+        self.done = 0
+        self.first_done = 0
+        self.started_at = None
+        self.finished_at = None
+        self.samples = deque(maxlen=RATE_WINDOW)  # (timestamp, bytes done)
+        self.ewma = 0.0
+
+    def start(self, done=0, now=None):
+        now = time.monotonic() if now is None else now
+        self.started_at = now
+        self.finished_at = None
+        self.done = self.first_done = done
+        self.samples.clear()
+        self.samples.append((now, done))
+        self.ewma = 0.0
+
+    def update(self, done, now=None):
+        now = time.monotonic() if now is None else now
+        if self.started_at is None:
+            self.start(done, now)
+            return
+        last_time, last_done = self.samples[-1]
+        elapsed = now - last_time
+        if elapsed > 0:
+            rate = (done - last_done) / elapsed
+            if self.ewma:
+                # Time based weight so the smoothing does not depend on the chunk size
+                weight = 1 - math.exp(-elapsed / EWMA_TIME_CONSTANT)
+                self.ewma += weight * (rate - self.ewma)
+            else:
+                self.ewma = rate
+            self.samples.append((now, done))
+        self.done = done
+
+    def finish(self, now=None):
+        self.finished_at = time.monotonic() if now is None else now
+        if self.started_at is None:
+            self.started_at = self.finished_at
+
+    @property
+    def remaining(self):
+        return max(self.total - self.done, 0)
+
+    def elapsed(self, now=None):
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else (time.monotonic() if now is None else now)
+        return end - self.started_at
+
+    def instant_rate(self):
+        if len(self.samples) < 2:
+            return 0.0
+        (first_time, first_done), (last_time, last_done) = self.samples[0], self.samples[-1]
+        return (last_done - first_done) / (last_time - first_time)
+
+    def average_rate(self, now=None):
+        elapsed = self.elapsed(now)
+        return (self.done - self.first_done) / elapsed if elapsed > 0 else 0.0
+
+    def rate(self):
+        """Smoothed rate, falling back to the average until enough samples arrived."""
+        return self.ewma or self.average_rate()
+
+    def snapshot(self, now=None):
+        return {
+            "done": self.done,
+            "total": self.total,
+            "elapsed": self.elapsed(now),
+            "instant_rate": self.instant_rate(),
+            "smoothed_rate": self.rate(),
+            "average_rate": self.average_rate(now),
+            "finished": self.finished_at is not None,
+        }
+
+class ThroughputTracker:
+    """Per-phase throughput of one task (probe, download, upload, send) with a combined ETA."""
+
+    def __init__(self, file_size=0):
+        self.phases = {phase: PhaseThroughput() for phase in PHASES}
+        self.set_file_size(file_size)
+
+    def set_file_size(self, file_size):
+        self.set_totals(file_size, file_size)
+
+    def set_totals(self, download_total, upload_total):
+        self.phases["download"].total = download_total
+        self.phases["upload"].total = upload_total
+
+    def start(self, phase, done=0):
+        self.phases[phase].start(done)
+
+    def update(self, phase, done):
+        self.phases[phase].update(done)
+
+    def finish(self, phase):
+        self.phases[phase].finish()
+
+    def fraction(self):
+        """Progress over download and upload together, so the bar never jumps back to 0%."""
+        download, upload = self.phases["download"], self.phases["upload"]
+        total = download.total + upload.total
+        if not total:
+            return 0.0
+        return (min(download.done, download.total) + min(upload.done, upload.total)) / total
+
+    def eta(self):
+        """Seconds until download and upload are both done, or None while no rate is known."""
+        download, upload = self.phases["download"], self.phases["upload"]
+        download_rate = download.rate()
+        # Before the upload starts assume it runs about as fast as the download
+        upload_rate = upload.rate() or download_rate
+        eta = 0.0
+        for remaining, rate in ((download.remaining, download_rate), (upload.remaining, upload_rate)):
+            if remaining:
+                if rate <= 0:
+                    return None
+                eta += remaining / rate
+        return eta
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {phase: throughput.snapshot(now) for phase, throughput in self.phases.items()}
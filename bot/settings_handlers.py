@@ -1,9 +1,7 @@
-from telethon import events, Button, types  # Import types
+from telethon import Button, types, utils  # Import types
 from bot.utils import get_user_settings, set_user_setting, upload_thumb
 import logging
 import os
-from telethon.tl.functions.messages import SendMediaRequest
-from telethon.tl.types import InputMediaUploadedPhoto
 
 async def settings_handler(event):
     user_id = event.sender_id
@@ -12,7 +10,8 @@ async def settings_handler(event):
         "Current Settings:\n\n"
         f"🖼️ **Thumbnail:** {user_settings['thumbnail'] if user_settings['thumbnail'] else 'Default'}\n"
         f"✍️ **Prefix:** {user_settings['prefix'] if user_settings['prefix'] else 'Default'}\n"
-        f"✏️ **Rename Rules:** {', '.join(user_settings['rename_rules']) if user_settings['rename_rules'] else 'None'}\n\n"
+        f"✏️ **Rename Rules:** {', '.join(user_settings['rename_rules']) if user_settings['rename_rules'] else 'None'}\n"
+        f"📤 **Also Send To:** {', '.join(str(d) for d in user_settings['destinations']) if user_settings['destinations'] else 'None'}\n\n"
         "What do you want to change?"
     )
     buttons = [
@@ -20,6 +19,8 @@ async def settings_handler(event):
         [Button.inline("✍️ Set Prefix", data="set_prefix")],
         [Button.inline("✏️ Add Rename Rule", data="add_rename_rule")],
         [Button.inline("❌ Remove Rename Rule", data="remove_rename_rule")],
+        [Button.inline("📤 Add Destination", data="add_destination")],
+        [Button.inline("🗑️ Remove Destination", data="remove_destination")],
         [Button.inline("✅ Done", data="done_settings")]]
     await event.respond(message, buttons=buttons)
 
@@ -64,6 +65,44 @@ async def remove_rule_callback_handler(event):
     else:
         await event.answer("Invalid rule index.")
 
+async def add_destination_handler(event):
+    user_id = event.sender_id
+    event.client.task_data = event.client.task_data if hasattr(event.client, 'task_data') else {}
+    event.client.task_data.setdefault(str(user_id), {}).update({"status": "add_destination"})
+    await event.answer(message="Please send me the @username or ID of the chat (the bot must be able to post there):")
+
+async def remove_destination_handler(event):
+    user_id = event.sender_id
+    user_settings = get_user_settings(user_id)
+    if user_settings["destinations"]:
+        buttons = [[Button.inline(str(destination), data=f"remove_dest_{i}")] for i, destination in enumerate(user_settings["destinations"])]
+        await event.respond("Which destination do you want to remove?", buttons=buttons)
+    else:
+        await event.answer("You don't have any destinations set.")
+
+async def remove_destination_callback_handler(event):
+    user_id = event.sender_id
+    destination_index = int(event.data.decode().split("_")[-1])
+    user_settings = get_user_settings(user_id)
+    if 0 <= destination_index < len(user_settings["destinations"]):
+        removed_destination = user_settings["destinations"].pop(destination_index)
+        set_user_setting(user_id, "destinations", user_settings["destinations"])
+        await event.answer(f"Removed destination: {removed_destination}")
+        await settings_handler(event)  # Refresh settings
+    else:
+        await event.answer("Invalid destination index.")
+
+async def can_post_to(client, destination, user_id):
+    """A user may only fan out to themselves or to chats they administer."""
+    if isinstance(destination, types.InputPeerUser):
+        return destination.user_id == user_id
+    try:
+        permissions = await client.get_permissions(destination, user_id)
+    except Exception as e:
+        logging.warning(f"Could not check permissions of {user_id} in {destination}: {e}")
+        return False
+    return permissions.is_admin or permissions.is_creator
+
 async def done_settings_handler(event):
     await event.answer("Settings saved!")
     await event.delete()
@@ -119,3 +158,28 @@ async def process_settings_input(event):
             if str(user_id) in event.client.task_data:
                 del event.client.task_data[str(user_id)]
             await settings_handler(event)
+
+    elif status == "add_destination":
+            text = event.text.strip()
+            destination = int(text) if text.lstrip("-").isdigit() else text
+            user_settings = get_user_settings(user_id)
+            try:
+                peer = await event.client.get_input_entity(destination)
+            except Exception as e:
+                logging.error(f"Error in process_settings_input add_destination: {e}")
+                peer = None
+                await event.respond(f"Could not find the chat {destination}. Add the bot there first.")
+            if peer is not None:
+                # Stored by ID so a username that later changes hands cannot redirect the files
+                destination = utils.get_peer_id(peer)
+                if not await can_post_to(event.client, peer, user_id):
+                    await event.respond(f"You can only add yourself or chats where you are an admin.")
+                elif destination not in user_settings["destinations"]:
+                    user_settings["destinations"].append(destination)
+                    set_user_setting(user_id, "destinations", user_settings["destinations"])
+                    await event.respond(f"Added destination: {destination}")
+                else:
+                    await event.respond(f"Destination already exists: {destination}")
+            if str(user_id) in event.client.task_data:
+                del event.client.task_data[str(user_id)]
+            await settings_handler(event)
@@ -1,29 +1,37 @@
 import asyncio
 import logging
 import os
-import time
 import math
+import uuid
 import aiohttp
-import magic
 
-from telethon import types
 from telethon.errors import FloodWaitError
 from telethon.tl.functions.messages import SendMediaRequest
-from telethon.tl.types import InputMediaUploadedDocument, DocumentAttributeFilename, InputMediaUploadedPhoto, InputFile
 from telethon.tl.functions.upload import GetFileRequest
-from telethon.tl.types import InputFile, InputMediaUploadedPhoto, InputMedia
+from telethon.tl.types import InputMediaUploadedDocument, DocumentAttributeFilename, DocumentAttributeVideo, InputMediaUploadedPhoto, InputFile, InputMedia, InputDocument, InputMediaDocument
 
-from bot.config import MAX_RETRIES, RETRY_DELAY, CHUNK_SIZE, MAX_FILE_PARTS
-from bot.progress import ProgressBar
-from bot.utils import upload_thumb
+from bot.config import MAX_RETRIES, RETRY_DELAY, CHUNK_SIZE, MAX_FILE_PARTS, JOURNAL_OFFSET_INTERVAL
+from bot.utils import upload_thumb, get_input_peer, get_user_settings
+from bot.media_probe import is_video, probe_transfer
+
+_fan_out_tasks = set()  # Keeps detached fan-out tasks referenced until they finish
+
+_mime_detector = None
+
+def get_mime_detector():
+    # libmagic is slow to load, so it is only imported once the first upload needs it
+    global _mime_detector
+    if _mime_detector is None:
+        import magic
+        _mime_detector = magic.Magic(mime=True)
+    return _mime_detector
 
 async def download_and_upload(event, url, file_name, file_size, mime_type, task_id, file_extension, current_event, user_id, progress_manager):
     temp_file_path = f"temp_{task_id}"
+    keep_spool = False
+    probe_task = None
     try:
         downloaded_size = 0
-        start_time = time.time()
-        download_speed = 0
-        upload_speed = 0
 
         task_data = progress_manager.get_task(task_id)
         if task_data is None:
@@ -38,16 +46,40 @@ async def download_and_upload(event, url, file_name, file_size, mime_type, task_
         if message_id:
             progress_bar.set_message_id(message_id)
 
+        # Resume a spool file left behind by a previous run, trusting only the journaled offset
+        resume_offset = task_data.get("offset", 0)
+        if resume_offset and os.path.exists(temp_file_path):
+            downloaded_size = min(resume_offset, os.path.getsize(temp_file_path))
+            os.truncate(temp_file_path, downloaded_size)
+            logging.info(f"Resuming task {task_id} from offset {downloaded_size}")
+        journaled_size = downloaded_size
+        tracker = progress_bar.tracker
+        tracker.start("download", downloaded_size)
+
+        # Video metadata is probed alongside the transfer, the upload only awaits it right before sending
+        download_done = asyncio.Event()
+        if is_video(file_name, mime_type):
+            probe_task = asyncio.create_task(probe_transfer(url, temp_file_path, file_size, task_data.get("accept_ranges"), download_done))
+        progress_manager.set_state(task_id, "downloading", offset=downloaded_size)
+
         for attempt in range(MAX_RETRIES):
+            if file_size and downloaded_size == file_size:
+                break
             try:
+                headers = {"Range": f"bytes={downloaded_size}-"} if downloaded_size else None
                 async with aiohttp.ClientSession() as session:
-                    async with session.get(url, timeout=None) as response:
+                    async with session.get(url, headers=headers, timeout=None) as response:
                         response.raise_for_status()
+                        if downloaded_size and response.status != 206:
+                            logging.warning(f"Server ignored range request for task {task_id}, restarting download")
+                            downloaded_size = journaled_size = 0
+                            tracker.start("download")
 
-                        with open(temp_file_path, "wb") as temp_file:
+                        with open(temp_file_path, "ab" if downloaded_size else "wb") as temp_file:
                             while True:
                                 if progress_manager.get_cancel_flag(task_id):
                                     logging.info(f"Task {task_id} canceled by user.")
+                                    progress_manager.set_state(task_id, "cancelled")
                                     return
                                 chunk = await response.content.readany()
                                 if not chunk:
@@ -55,10 +87,15 @@ async def download_and_upload(event, url, file_name, file_size, mime_type, task_
 
                                 temp_file.write(chunk)
                                 downloaded_size += len(chunk)
-                                elapsed_time = time.time() - start_time
-                                if elapsed_time > 0:
-                                    download_speed = downloaded_size / elapsed_time
-                                await progress_bar.update_progress(downloaded_size / file_size, download_speed=download_speed)
+                                if downloaded_size - journaled_size >= JOURNAL_OFFSET_INTERVAL:
+                                    temp_file.flush()
+                                    await asyncio.to_thread(os.fsync, temp_file.fileno())
+                                    progress_manager.set_state(
+                                        task_id, "downloading", offset=downloaded_size,
+                                        progress_message_id=getattr(progress_bar.message, "id", progress_bar.message)
+                                    )
+                                    journaled_size = downloaded_size
+                                await progress_bar.update_progress("download", downloaded_size)
                         break
             except aiohttp.ClientError as e:
                 logging.error(f"Download error (attempt {attempt + 1}/{MAX_RETRIES}) from {url}: {e}, url:{url}")
@@ -66,87 +103,214 @@ async def download_and_upload(event, url, file_name, file_size, mime_type, task_
                     await asyncio.sleep(RETRY_DELAY)
                 else:
                     logging.error(f"Maximum retries reached for download from {url}, url: {url}")
+                    progress_manager.set_state(task_id, "failed")
                     await current_event.respond(f"Download Error: {e}. Maximum retries reached.")
                     return
             except Exception as e:
                 logging.error(f"An exception occurred in download_and_upload while downloading file : {e}, url: {url}")
+                progress_manager.set_state(task_id, "failed")
                 await current_event.respond(f"An error occurred : {e}")
                 return
 
+        tracker.finish("download")
+        download_done.set()
         if downloaded_size == file_size:
-            upload_task = asyncio.create_task(upload_file(event, temp_file_path, file_name, file_size, mime_type, task_id, file_extension, progress_bar, current_event, user_id))
-            await upload_task
+            progress_manager.set_state(
+                task_id, "uploading", offset=downloaded_size,
+                progress_message_id=getattr(progress_bar.message, "id", progress_bar.message)
+            )
+            upload_task = asyncio.create_task(upload_file(event, temp_file_path, file_name, file_size, mime_type, task_id, file_extension, progress_bar, current_event, user_id, progress_manager, video_probe=probe_task))
+            uploaded = await upload_task
+            progress_manager.set_state(task_id, "done" if uploaded else "failed")
         else:
+            progress_manager.set_state(task_id, "failed")
             await current_event.respond(
                 f"Error: Download incomplete (Size mismatch) file_size is: {file_size} and downloaded size is: {downloaded_size}")
             logging.error(f"Download incomplete for {url}: expected {file_size} bytes, got {downloaded_size} bytes")
 
+    except asyncio.CancelledError:
+        # Shutting down: keep the spool file so the journaled task can resume on restart
+        keep_spool = True
+        raise
     except Exception as e:
         logging.error(f"An unexpected error occurred in download_and_upload: {e}, url: {url}")
+        progress_manager.set_state(task_id, "failed")
         await current_event.respond(f"An error occurred: {e}")
     finally:
-        if os.path.exists(temp_file_path):
+        if probe_task and not probe_task.done():
+            probe_task.cancel()
+        if not keep_spool and os.path.exists(temp_file_path):
             os.remove(temp_file_path)
         progress_manager.remove_task(task_id)
 
-async def upload_file(event, temp_file_path, file_name, file_size, mime_type, task_id, file_extension, progress_bar, current_event, user_id):
-    start_upload_time = time.time()
-    try:
-        with open(temp_file_path, "rb") as f:
-            mime = magic.Magic(mime=True)
-            mime_type = mime.from_file(temp_file_path)
-
-            parts = math.ceil(file_size / CHUNK_SIZE)
-            upload_chunk_size = CHUNK_SIZE
-            if parts > MAX_FILE_PARTS:
-                upload_chunk_size = math.ceil(file_size / MAX_FILE_PARTS)
-                logging.warning(f"Reducing upload chunk size to {upload_chunk_size / (1024*1024):.2f} MB due to excessive parts {parts}")
-
-            thumb = await upload_thumb(current_event, user_id)
-            uploaded_thumb = None
-
-            if thumb:
-                try:
-                    thumb_file = await event.client(GetFileRequest(location=InputFile(id=thumb,
-                                                                                        access_hash=0,
-                                                                                        file_reference=b'')))
-                    uploaded_thumb = await event.client.upload_file(thumb_file.bytes)
-                    thumb = InputMediaUploadedPhoto(file=uploaded_thumb)
-
-
-                except Exception as e:
-                    logging.error(f"Error fetching thumbnail: {e}")
-                    thumb = None
-
-            file = await event.client.upload_file(
-                f,
-                file_name=file_name,
-                progress_callback=lambda current, total: progress_bar.update_progress(current / total)
-            )
+async def send_file(event, file_path, file_name, file_size, current_event, user_id, progress_manager, tracker=None, progress_callback=None, video_probe=None):
+    """Uploads `file_path` and sends it as a document to the chat of `current_event`."""
+    with open(file_path, "rb") as f:
+        mime_type = get_mime_detector().from_file(file_path)
 
-            elapsed_upload_time = time.time() - start_upload_time
-            upload_speed = file_size / elapsed_upload_time if elapsed_upload_time > 0 else 0
-            await progress_bar.update_progress(1, upload_speed=upload_speed)
+        parts = math.ceil(file_size / CHUNK_SIZE)
+        upload_chunk_size = CHUNK_SIZE
+        if parts > MAX_FILE_PARTS:
+            upload_chunk_size = math.ceil(file_size / MAX_FILE_PARTS)
+            logging.warning(f"Reducing upload chunk size to {upload_chunk_size / (1024*1024):.2f} MB due to excessive parts {parts}")
 
-            media = InputMediaUploadedDocument(
-                file=file,
-                mime_type=mime_type,
-                attributes=[DocumentAttributeFilename(file_name)],
-                thumb=thumb if isinstance(thumb, InputMedia) else None
-            )
+        thumb = await upload_thumb(current_event, user_id)
+        uploaded_thumb = None
+
+        if thumb:
+            try:
+                thumb_file = await event.client(GetFileRequest(location=InputFile(id=thumb,
+                                                                                    access_hash=0,
+                                                                                    file_reference=b'')))
+                uploaded_thumb = await event.client.upload_file(thumb_file.bytes)
+                thumb = InputMediaUploadedPhoto(file=uploaded_thumb)
 
 
-            await event.client(SendMediaRequest(
-                peer=await event.client.get_input_entity(current_event.chat_id),
-                media=media,
-                message=f"File Name: {file_name}",
+            except Exception as e:
+                logging.error(f"Error fetching thumbnail: {e}")
+                thumb = None
+
+        if tracker:
+            tracker.start("upload")
+        file = await event.client.upload_file(
+            f,
+            file_name=file_name,
+            progress_callback=progress_callback
+        )
+        if tracker:
+            tracker.finish("upload")
+
+        attributes = [DocumentAttributeFilename(file_name)]
+        metadata = None
+        if video_probe:
+            try:
+                metadata = await video_probe
+            except Exception as e:
+                logging.warning(f"Video probe failed for {file_name}: {e}")
+        if metadata:
+            attributes.append(DocumentAttributeVideo(
+                duration=int(metadata["duration"]),
+                w=metadata["width"],
+                h=metadata["height"],
+                supports_streaming=metadata["supports_streaming"],
+                video_start_ts=metadata["thumbnail_offset"]
             ))
-            await progress_bar.stop("Upload Complete")
+
+        media = InputMediaUploadedDocument(
+            file=file,
+            mime_type=mime_type,
+            attributes=attributes,
+            thumb=thumb if isinstance(thumb, InputMedia) else None
+        )
+
+        if tracker:
+            tracker.start("send")
+        result = await event.client(SendMediaRequest(
+            peer=await get_input_peer(event.client, current_event.chat_id),
+            media=media,
+            message=f"File Name: {file_name}",
+        ))
+
+        if tracker:
+            tracker.finish("send")
+
+        destinations = get_user_settings(user_id)["destinations"]
+        if destinations:
+            document = get_sent_document(result)
+            if document is None:
+                logging.error("Could not find the sent document to forward to the destinations")
+                await current_event.respond(f"Could not send {file_name} to: {', '.join(str(d) for d in destinations)}")
+                return
+            # Journaled before the calling task is marked done, so a restart still delivers the copies
+            fan_out_id = str(uuid.uuid4())
+            progress_manager.add_task(fan_out_id, {
+                "task_id": fan_out_id,
+                "state": "fanning_out",
+                "chat_id": current_event.chat_id,
+                "user_id": user_id,
+                "fan_out": {
+                    "document": [document.id, document.access_hash, document.file_reference.hex()],
+                    "destinations": destinations,
+                    "file_name": file_name,
+                },
+            })
+            start_fan_out(event.client, fan_out_id, progress_manager)
+
+def get_sent_document(result):
+    for update in getattr(result, "updates", []):
+        media = getattr(getattr(update, "message", None), "media", None)
+        document = getattr(media, "document", None)
+        if document:
+            return InputDocument(id=document.id, access_hash=document.access_hash, file_reference=document.file_reference)
+    return None
+
+async def send_to_destination(client, destination, media, caption):
+    # Each destination retries on its own, so a FloodWait on one chat does not hold up the others
+    for attempt in range(MAX_RETRIES):
+        try:
+            await client(SendMediaRequest(peer=await get_input_peer(client, destination), media=media, message=caption))
+            return True
+        except FloodWaitError as e:
+            logging.warning(f"Flood wait error while sending to {destination}: {e}")
+            await asyncio.sleep(e.seconds)
+        except Exception as e:
+            logging.error(f"Error sending to {destination} (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
+            await asyncio.sleep(RETRY_DELAY)
+    return False
+
+def start_fan_out(client, fan_out_id, progress_manager):
+    # Detached so a FloodWait on a backup chat holds up neither the task's status nor an upload worker
+    fan_out_task = asyncio.create_task(fan_out(client, fan_out_id, progress_manager))
+    _fan_out_tasks.add(fan_out_task)
+    fan_out_task.add_done_callback(_fan_out_tasks.discard)
+
+async def fan_out(client, fan_out_id, progress_manager):
+    """Re-sends an already uploaded document to every pending destination and reports the ones that failed.
+
+    Every finished destination is journaled, a restart only resumes the ones still pending.
+    """
+    task_data = progress_manager.get_task(fan_out_id)
+    fan_out_data = task_data["fan_out"]
+    document_id, access_hash, file_reference = fan_out_data["document"]
+    media = InputMediaDocument(id=InputDocument(id=document_id, access_hash=access_hash, file_reference=bytes.fromhex(file_reference)))
+    file_name = fan_out_data["file_name"]
+    caption = f"File Name: {file_name}"
+    destinations = list(fan_out_data["destinations"])
+    pending = list(destinations)
+
+    async def deliver(destination):
+        ok = await send_to_destination(client, destination, media, caption)
+        pending.remove(destination)
+        progress_manager.set_state(fan_out_id, "fanning_out", fan_out={**fan_out_data, "destinations": list(pending)})
+        return ok
+
+    sent = await asyncio.gather(*(deliver(destination) for destination in destinations))
+    progress_manager.set_state(fan_out_id, "done")
+    progress_manager.remove_task(fan_out_id)
+    failed = [destination for destination, ok in zip(destinations, sent) if not ok]
+    if failed:
+        try:
+            await client.send_message(task_data["chat_id"], f"Could not send {file_name} to: {', '.join(str(d) for d in failed)}")
+        except Exception as e:
+            logging.error(f"Failed to report fan-out errors for {file_name}: {e}")
+
+async def upload_file(event, temp_file_path, file_name, file_size, mime_type, task_id, file_extension, progress_bar, current_event, user_id, progress_manager, video_probe=None):
+    tracker = progress_bar.tracker
+    try:
+        await send_file(
+            event, temp_file_path, file_name, file_size, current_event, user_id, progress_manager, tracker=tracker,
+            progress_callback=lambda current, total: progress_bar.update_progress("upload", current),
+            video_probe=video_probe
+        )
+        logging.info(f"Task {task_id} throughput: {tracker.snapshot()}")
+        await progress_bar.stop("Upload Complete")
+        return True
 
     except FloodWaitError as e:
         logging.warning(f"Flood wait error during upload: {e}")
         await asyncio.sleep(e.seconds)
-        await upload_file(event, temp_file_path, file_name, file_size, mime_type, task_id, file_extension, progress_bar, current_event, user_id)
+        return await upload_file(event, temp_file_path, file_name, file_size, mime_type, task_id, file_extension, progress_bar, current_event, user_id, progress_manager, video_probe=video_probe)
     except Exception as e:
         logging.error(f"An error occurred during upload: {e}")
         await current_event.respond(f"An error occurred during upload: {e}")
+        return False
@@ -4,12 +4,16 @@ from urllib.parse import urlparse, unquote
 import logging
 import json
 import aiohttp
-from telethon.tl.functions.messages import SendMediaRequest
-from telethon.tl.types import InputMediaUploadedPhoto
 from bot.config import DEFAULT_THUMBNAIL
 
 SETTINGS_FILE = "bot/settings.json"  # Path to your settings file
 
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+SPOOL_PATTERN = re.compile(r"temp_([0-9a-f-]{36})(_\d+)?")  # temp_{task_id} and archive members temp_{task_id}_{index}
+
+_input_peers = {}  # chat_id -> resolved InputPeer
+
 def get_file_name_extension(url):
     try:
         parsed_url = urlparse(url)
@@ -40,6 +44,26 @@ def extract_filename_from_content_disposition(content_disposition):
 
     return None
 
+def get_archive_type(file_name):
+    file_name = file_name.lower()
+    if file_name.endswith(".zip"):
+        return "zip"
+    if file_name.endswith(TAR_EXTENSIONS):
+        return "tar"
+    return None
+
+def remove_stale_spools(keep_task_ids, directory="."):
+    """Deletes spool files left by tasks that are not resumed, only the download spools in `keep_task_ids` stay."""
+    for name in os.listdir(directory):
+        match = SPOOL_PATTERN.fullmatch(name)
+        if not match or (match.group(1) in keep_task_ids and not match.group(2)):
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+            logging.info(f"Removed stale spool file {name}")
+        except OSError as e:
+            logging.error(f"Failed to remove stale spool file {name}: {e}")
+
 def load_settings():
     try:
         with open(SETTINGS_FILE, "r") as f:
@@ -53,11 +77,13 @@ def save_settings(settings):
 
 def get_user_settings(user_id):
     settings = load_settings()
-    return settings.get(str(user_id), {
+    user_settings = settings.get(str(user_id), {
         "thumbnail": None,
         "prefix": None,
         "rename_rules": []
     })
+    user_settings.setdefault("destinations", [])  # Added later, older entries lack it
+    return user_settings
 
 def set_user_setting(user_id, key, value):
     settings = load_settings()
@@ -66,7 +92,8 @@ def set_user_setting(user_id, key, value):
         settings[user_id_str] = {
             "thumbnail": None,
             "prefix": None,
-            "rename_rules": []
+            "rename_rules": [],
+            "destinations": []
         }
     settings[user_id_str][key] = value
     save_settings(settings)
@@ -85,3 +112,10 @@ async def upload_thumb(event, user_id, file=None):
             return thumbnail_id
 
     return None
+
+async def get_input_peer(client, chat_id):
+    peer = _input_peers.get(chat_id)
+    if peer is None:
+        peer = await client.get_input_entity(chat_id)
+        _input_peers[chat_id] = peer
+    return peer
@@ -0,0 +1,22 @@
+import asyncio
+import time
+
+from bot.services.loop_monitor import LoopLagMonitor
+
+
+def test_short_blocking_call_is_recorded_as_blocker():
+    async def run():
+        monitor = LoopLagMonitor(0.5, 0.1)
+        monitor.start()
+        await asyncio.sleep(0.2)
+        for _ in range(3):
+            time.sleep(0.25)  # Stalls the loop just past the threshold
+            await asyncio.sleep(0.1)
+        monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(run())
+
+    assert monitor.blockers
+    assert any("test_loop_monitor.py" in location for location in monitor.blockers)
+    assert monitor.max_lag >= 0.2
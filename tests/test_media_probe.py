@@ -0,0 +1,33 @@
+import struct
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from bot.media_probe import probe_media
+
+
+def box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mp4(handler, width, height, duration=120):
+    mvhd = box(b"mvhd", bytes(12) + struct.pack(">II", 1000, duration * 1000) + bytes(80))
+    tkhd = box(b"tkhd", bytes(76) + struct.pack(">II", width << 16, height << 16))
+    hdlr = box(b"hdlr", bytes(8) + handler + bytes(12))
+    moov = box(b"moov", mvhd + box(b"trak", tkhd + box(b"mdia", hdlr)))
+    return box(b"ftyp", b"isom" + bytes(4)) + moov + box(b"mdat", bytes(64))
+
+
+def test_video_mp4_reports_dimensions():
+    data = mp4(b"vide", 1280, 720)
+    metadata = probe_media(data, data, len(data))
+
+    assert (metadata["width"], metadata["height"], metadata["duration"]) == (1280, 720, 120)
+    assert metadata["supports_streaming"]
+
+
+def test_audio_only_mp4_is_not_a_video():
+    data = mp4(b"soun", 0, 0)
+
+    assert probe_media(data, data, len(data)) is None
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telethon")
+
+from bot.progress import ProgressBar
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = 0
+        self.edits = 0
+
+    async def send_message(self, chat_id, text, buttons=None):
+        self.sent += 1
+        await asyncio.sleep(0.05)
+        return self.sent
+
+    async def edit_message(self, chat_id, message, text, buttons=None):
+        self.edits += 1
+        await asyncio.sleep(0.05)
+
+
+class FakeEvent:
+    chat_id = 1
+
+
+def test_overlapping_updates_send_one_status_message():
+    async def run():
+        client = FakeClient()
+        progress_bar = ProgressBar(1000, "Processing", client, FakeEvent(), "task", "file.bin", 1000)
+        await asyncio.gather(*(progress_bar.update_progress("download", done) for done in range(30, 900, 30)))
+        await progress_bar.stop("Upload Complete")
+        return client
+
+    client = asyncio.run(run())
+
+    assert client.sent == 1
+    assert client.edits == 1  # Only the final text, the overlapping renders were skipped
@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from bot.utils import remove_stale_spools
+
+RESUMED = "0f8fad5b-d9cb-469f-a165-70867728950e"
+DROPPED = "7c9e6679-7425-40de-944b-e07fc1f90ae7"
+
+
+def test_only_resumed_download_spools_are_kept(tmp_path):
+    names = [f"temp_{RESUMED}", f"temp_{RESUMED}_3", f"temp_{DROPPED}", f"temp_{DROPPED}_0", "temp_notes.txt"]
+    for name in names:
+        (tmp_path / name).write_bytes(b"x")
+
+    remove_stale_spools({RESUMED}, tmp_path)
+
+    assert sorted(os.listdir(tmp_path)) == sorted([f"temp_{RESUMED}", "temp_notes.txt"])